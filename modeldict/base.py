@@ -1,23 +1,81 @@
+import logging
 import time
 
+from bisect import bisect_left
+
 from django.core.cache import cache
 
+from modeldict.cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
 NoValue = object()
 
 
+class DictSnapshot(dict):
+    """
+    A read-only copy of a ``CachedDict`` at a single point in time.
+
+    Lookups are plain ``dict`` lookups and never check for remote changes, nor
+    fall back to ``get_default`` for missing keys.
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('%s is read-only' % (type(self).__name__,))
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
 class CachedDict(object):
-    def __init__(self, cache=cache, timeout=30):
+    def __init__(self, cache=cache, timeout=30, indexes=None, transform=None):
         cls_name = type(self).__name__
 
         self._local_cache = None
         self._local_last_updated = None
+        self._local_indexes = {}
+        self._local_sorted_keys = None
+        self._local_snapshot = None
+
+        # Maps an index name to a function of ``(key, value)`` returning the
+        # value that key should be found under in that index.
+        self.indexes = indexes or {}
+
+        # Applied to each value when a snapshot is loaded, so that reads return
+        # the already transformed value. The raw values of the last snapshot
+        # loaded are kept so unchanged values are not transformed again.
+        self.transform = transform
+        self._last_loaded = None
+
+        self._subscribers = []
+        self._pending_changes = None
 
         self._last_checked_for_remote_changes = None
         self.timeout = timeout
 
+        if isinstance(cache, (list, tuple)):
+            if timeout > 0:
+                # The closer tiers must not hold on to the last updated key for
+                # longer than we'd wait before checking it again
+                timeouts = [timeout] * (len(cache) - 1) + [None]
+                cache = TieredCache(cache, timeouts)
+            else:
+                # The closer tiers would have to expire everything at once, and
+                # some backends read a timeout of 0 as their default
+                cache = cache[-1]
+
         self.remote_cache = cache
         self.remote_cache_key = cls_name
         self.remote_cache_last_updated_key = '%s.last_updated' % (cls_name,)
+        self._bind_remote_cache_keys()
 
     def __getitem__(self, key):
         self._populate()
@@ -77,6 +135,33 @@ class CachedDict(object):
         self._populate()
         return self._local_cache.items()
 
+    def keys_with_prefix(self, prefix):
+        """
+        Returns an iterator over the keys starting with ``prefix``, in sorted
+        order. Keys must be strings.
+        """
+        data, keys = self._get_sorted_keys()
+
+        def iterator():
+            for idx in xrange(bisect_left(keys, prefix), len(keys)):
+                key = keys[idx]
+                if not key.startswith(prefix):
+                    break
+                yield key
+        return iterator()
+
+    def items_in_range(self, start=None, stop=None):
+        """
+        Returns an iterator over the ``(key, value)`` pairs where
+        ``start <= key < stop``, in key order. Either bound may be ``None``.
+        """
+        data, keys = self._get_sorted_keys()
+
+        lo = 0 if start is None else bisect_left(keys, start)
+        hi = len(keys) if stop is None else bisect_left(keys, stop)
+
+        return ((keys[idx], data[keys[idx]]) for idx in xrange(lo, hi))
+
     def get(self, key, default=None):
         self._populate()
         return self._local_cache.get(key, default)
@@ -95,9 +180,56 @@ class CachedDict(object):
         if key not in self:
             self[key] = value
 
+    def subscribe(self, func):
+        """
+        Registers ``func`` to be called whenever a refresh changes the
+        contents of the dictionary::
+
+            def func(sender, added, changed, removed):
+                ...
+
+        ``added``, ``changed`` and ``removed`` are sets of keys. Exceptions
+        raised by ``func`` are logged rather than propagated.
+        """
+        if func not in self._subscribers:
+            self._subscribers.append(func)
+
+    def unsubscribe(self, func):
+        if func in self._subscribers:
+            self._subscribers.remove(func)
+
+    def snapshot(self):
+        """
+        Returns a read-only view of the current contents which is unaffected
+        by later refreshes. It may also be used as a context manager::
+
+            with mydict.snapshot() as data:
+                data['foo']
+        """
+        self._populate()
+        data = self._local_cache
+
+        # Kept along with the data it was copied from, so that a copy made by
+        # another thread of an older snapshot is never returned
+        snapshot = self._local_snapshot
+        if snapshot is None or snapshot[0] is not data:
+            snapshot = (data, DictSnapshot(data))
+            self._local_snapshot = snapshot
+        return snapshot[1]
+
     def get_default(self, key):
         return NoValue
 
+    def lookup(self, index, value):
+        """
+        Returns the keys stored under ``value`` in the named secondary index.
+
+        Indexes are built once per snapshot, so this avoids scanning every
+        item to find the matching keys.
+        """
+        self._populate()
+        return list(self._local_indexes[index].get(value, ()))
+
     def local_cache_has_expired(self):
         """
         Returns ``True`` if the in-memory cache has expired.
@@ -141,7 +273,7 @@ class CachedDict(object):
         """
         Clears the in-process cache.
         """
-        self._local_cache = None
+        self._set_local_cache(None)
         self._local_last_updated = None
         self._last_checked_for_remote_changes = None
 
@@ -160,12 +292,13 @@ class CachedDict(object):
         """
         now = int(time.time())
 
-        # If asked to reset, then simply set local cache to None
-        if reset:
-            self._local_cache = None
+        # If asked to reset, rebuild from the database. The current snapshot is
+        # kept until the new one has been loaded successfully.
+        update = reset
+
         # Otherwise, if the local cache has expired, we need to go check with
         # our remote last_updated value to see if the dict values have changed.
-        elif self.local_cache_has_expired():
+        if not reset and self.local_cache_has_expired():
 
             local_cache_is_invalid = self.local_cache_is_invalid()
 
@@ -178,23 +311,33 @@ class CachedDict(object):
             # pull in the values from the remote cache and set it to the
             # local_cache
             if local_cache_is_invalid or local_cache_is_invalid is None:
-                self._local_cache = self.remote_cache.get(self.remote_cache_key)
+                data = self.remote_cache.get(self.remote_cache_key)
+                if data is None:
+                    update = True
+                else:
+                    self._set_local_cache(data)
 
             # No matter what, we've updated from remote, so mark ourselves as
             # such so that we won't expire until the next timeout
             self._local_last_updated = now
 
         # Update from cache if local_cache is still empty
-        if self._local_cache is None:
+        if update or self._local_cache is None:
             self._update_cache_data()
 
         # No matter what happened, we last checked for remote changes just now
         self._last_checked_for_remote_changes = now
 
+        # Subscribers are only told about changes once we're fully refreshed,
+        # so that they may read from the dictionary themselves
+        if self._pending_changes is not None:
+            self._notify_subscribers()
+
         return self._local_cache
 
     def _update_cache_data(self):
-        self._local_cache = self.get_cache_data()
+        data = self.get_cache_data()
+        self._set_local_cache(data)
 
         now = int(time.time())
         self._local_last_updated = now
@@ -203,12 +346,129 @@ class CachedDict(object):
         # We only set remote_cache_last_updated_key when we know the cache is
         # current because setting this will force all clients to invalidate
         # their cached data if it's newer
-        self.remote_cache.set(self.remote_cache_key, self._local_cache)
+        self.remote_cache.set(self.remote_cache_key, data)
         self.remote_cache.set(
             self.remote_cache_last_updated_key,
             self._last_checked_for_remote_changes
         )
 
+    def _set_local_cache(self, data):
+        """
+        Replaces the in-process snapshot with ``data``, as returned by
+        ``get_cache_data``, and rebuilds the structures derived from it.
+
+        Everything is built before the new snapshot is published, so if the
+        transform fails the previous snapshot stays in place.
+        """
+        self._local_sorted_keys = None
+        self._local_snapshot = None
+
+        if data is None:
+            self._local_indexes = {}
+            self._local_cache = None
+            return
+
+        indexes = {}
+        for name, func in self.indexes.iteritems():
+            index = {}
+            for key, value in data.iteritems():
+                index.setdefault(func(key, value), []).append(key)
+            indexes[name] = index
+
+        local_cache = data
+        pending_changes = None
+
+        if self.transform is not None or self._subscribers:
+            added, changed, removed = self._diff_cache_data(data)
+
+            if self.transform is not None:
+                local_cache = self._transform_cache_data(data, added | changed)
+
+            if self._subscribers and (added or changed or removed):
+                pending_changes = (added, changed, removed)
+
+        self._last_loaded = (data, local_cache)
+        if pending_changes is not None:
+            self._pending_changes = pending_changes
+        self._local_indexes = indexes
+        self._local_cache = local_cache
+
+    def _diff_cache_data(self, data):
+        """
+        Returns the sets of keys added, changed and removed in ``data`` since
+        the last snapshot loaded.
+        """
+        if self._last_loaded is None:
+            last_data = {}
+        else:
+            last_data = self._last_loaded[0]
+
+        added, changed = set(), set()
+        for key, value in data.iteritems():
+            if key not in last_data:
+                added.add(key)
+            elif self._value_has_changed(last_data[key], value):
+                changed.add(key)
+        removed = set(key for key in last_data if key not in data)
+
+        return added, changed, removed
+
+    def _transform_cache_data(self, data, changed):
+        """
+        Applies ``transform`` to the values of the ``changed`` keys in
+        ``data``, reusing the results from the last snapshot for the others.
+        """
+        if self._last_loaded is None:
+            last_result = {}
+        else:
+            last_result = self._last_loaded[1]
+
+        result = {}
+        for key, value in data.iteritems():
+            if key in changed:
+                result[key] = self.transform(value)
+            else:
+                result[key] = last_result[key]
+        return result
+
+    def _notify_subscribers(self):
+        added, changed, removed = self._pending_changes
+        self._pending_changes = None
+
+        for func in list(self._subscribers):
+            try:
+                func(sender=self, added=added, changed=changed, removed=removed)
+            except Exception:
+                logger.exception('Error notifying %r of changes to %r', func, self)
+
+    def _value_has_changed(self, old, new):
+        return old != new
+
+    def _bind_remote_cache_keys(self):
+        """
+        Ties the cached data to its last updated key when using a tiered
+        cache. Must be called again if the remote cache keys change.
+        """
+        if isinstance(self.remote_cache, TieredCache):
+            self.remote_cache.bind(self.remote_cache_last_updated_key, self.remote_cache_key)
+
+    def _get_sorted_keys(self):
+        """
+        Returns the current snapshot and its keys in sorted order, sorting them
+        only once per snapshot.
+
+        The sorted keys are stored along with the snapshot they came from, so
+        that they're never paired with a snapshot loaded by another thread.
+        """
+        self._populate()
+        data = self._local_cache
+
+        sorted_keys = self._local_sorted_keys
+        if sorted_keys is None or sorted_keys[0] is not data:
+            sorted_keys = (data, sorted(data))
+            self._local_sorted_keys = sorted_keys
+        return sorted_keys
+
     def _get_cache_data(self):
         raise NotImplementedError
 
@@ -0,0 +1,101 @@
+class TieredCache(object):
+    """
+    Chains several cache backends together, ordered from the closest (e.g. a
+    host-local cache) to the most authoritative (e.g. the shared cluster), so
+    that most reads never leave the host::
+
+        cache = TieredCache([get_cache('local'), get_cache('default')], timeouts=[5, None])
+        mydict = ModelDict(Model, value='foo', cache=cache)
+
+    Reads go through the tiers in order and copy the value into the tiers which
+    missed it. Writes go to every tier, starting with the most authoritative.
+    ``timeouts`` gives the expiry used for each tier, and bounds how stale the
+    closer tiers may become, so every tier but the last needs a positive one.
+    It should be no longer than the ``timeout`` of the dicts using the cache.
+    A ``CachedDict`` given a list of caches uses its own ``timeout`` for every
+    tier but the last.
+
+    A key may be bound to a version key with ``bind``. The closer tiers record
+    which version their copy of a bound key was stored under, and drop that
+    copy when they fetch a different version, so a tier never serves data
+    older than the version it reports. Since they can't go stale, bound keys
+    are kept for the usual timeout rather than the tier's. Writers are
+    expected to set the bound keys before the version key.
+    """
+    def __init__(self, caches, timeouts):
+        self.caches = list(caches)
+        self.timeouts = list(timeouts)
+
+        assert len(self.timeouts) == len(self.caches)
+
+        for timeout in self.timeouts[:-1]:
+            if timeout is None or timeout <= 0:
+                raise ValueError('Every tier but the last needs a positive timeout')
+
+        self._bound_keys = {}
+        self._version_keys = {}
+
+    def bind(self, version_key, *keys):
+        self._bound_keys.setdefault(version_key, set()).update(keys)
+        for key in keys:
+            self._version_keys[key] = version_key
+
+    def get(self, key, default=None):
+        for idx, cache in enumerate(self.caches):
+            value = cache.get(key)
+            if value is not None:
+                self._fill(idx, key, value)
+                return value
+        return default
+
+    def set(self, key, value, timeout=None):
+        for idx in reversed(xrange(len(self.caches))):
+            cache = self.caches[idx]
+            cache.set(key, value, self._get_timeout(idx, key, timeout))
+            if idx < len(self.caches) - 1:
+                # The bound keys were just set alongside this version
+                for bound_key in self._bound_keys.get(key, ()):
+                    cache.set(self._get_marker_key(bound_key), value,
+                              self._get_timeout(idx, bound_key, timeout))
+
+    def add(self, key, value, timeout=None):
+        added = self.caches[-1].add(key, value, self._get_timeout(-1, key, timeout))
+        if added:
+            self._fill(len(self.caches) - 1, key, value, timeout)
+        return added
+
+    def delete(self, key):
+        for cache in reversed(self.caches):
+            cache.delete(key)
+
+    def _fill(self, count, key, value, timeout=None):
+        """
+        Copies ``value`` into the first ``count`` tiers, starting with the most
+        authoritative, dropping their copies of any keys bound to ``key`` which
+        were stored under a different version.
+        """
+        version_key = self._version_keys.get(key)
+
+        for idx in reversed(xrange(count)):
+            cache = self.caches[idx]
+
+            for bound_key in self._bound_keys.get(key, ()):
+                marker_key = self._get_marker_key(bound_key)
+                if cache.get(marker_key) != value:
+                    cache.delete_many([bound_key, marker_key])
+
+            cache.set(key, value, self._get_timeout(idx, key, timeout))
+
+            if version_key is not None:
+                version = cache.get(version_key)
+                if version is not None:
+                    cache.set(self._get_marker_key(key), version,
+                              self._get_timeout(idx, key, timeout))
+
+    def _get_marker_key(self, key):
+        return '%s.version' % (key,)
+
+    def _get_timeout(self, idx, key, timeout):
+        if self.timeouts[idx] is None or key in self._version_keys:
+            return timeout
+        return self.timeouts[idx]
@@ -39,10 +39,38 @@ class ModelDict(CachedDict):
         mydict['bar']
         >>> 'test' #doctest: +SKIP
 
+    Secondary indexes may be declared with ``indexes``, either as a list of
+    field names or as a dict mapping index names to field names or to
+    functions of ``(key, value)``. Indexes on fields other than ``value``
+    require ``instances=True``.
+
+        mydict = ModelDict(Model, key='foo', value='bar', indexes=['bar'])
+        mydict.lookup('bar', 'baz')
+        >>> ['test'] #doctest: +SKIP
+
+    A ``transform`` function may be given to parse each value once when the
+    dictionary is loaded, rather than on every access. Indexes are always
+    built from the untransformed values.
+
+        mydict = ModelDict(Model, key='foo', value='bar', transform=json.loads)
+
+    Passing a list of caches, or a ``TieredCache``, as ``cache`` will check
+    each of them in order before falling back to the database.
+
+        mydict = ModelDict(Model, key='foo', value='bar', cache=[local_cache, cache])
+
     """
     def __init__(self, model, key='pk', value=None, instances=False, auto_create=False, *args, **kwargs):
         assert value is not None
 
+        indexes = kwargs.pop('indexes', None) or {}
+        if not isinstance(indexes, dict):
+            indexes = dict((field, field) for field in indexes)
+        kwargs['indexes'] = dict(
+            (name, self._get_index_func(field, value, instances))
+            for name, field in indexes.iteritems()
+        )
+
         super(ModelDict, self).__init__(*args, **kwargs)
 
         cls_name = type(self).__name__
@@ -57,6 +85,7 @@ class ModelDict(CachedDict):
 
         self.remote_cache_key = '%s:%s:%s' % (cls_name, model_name, self.key)
         self.remote_cache_last_updated_key = '%s.last_updated:%s:%s' % (cls_name, model_name, self.key)
+        self._bind_remote_cache_keys()
 
         request_finished.connect(self._cleanup)
         post_save.connect(self._post_save, sender=model)
@@ -98,9 +127,29 @@ class ModelDict(CachedDict):
         if not self.auto_create:
             return NoValue
         result = self.model.objects.get_or_create(**{self.key: key})[0]
-        if self.instances:
-            return result
-        return getattr(result, self.value)
+        if not self.instances:
+            result = getattr(result, self.value)
+        if self.transform is not None:
+            result = self.transform(result)
+        return result
+
+    def _get_index_func(self, field, value, instances):
+        if callable(field):
+            return field
+        if instances:
+            return lambda k, v: getattr(v, field)
+        if field == value:
+            return lambda k, v: v
+        raise ValueError('Indexing on %r requires instances=True' % (field,))
+
+    def _value_has_changed(self, old, new):
+        if not self.instances:
+            return old != new
+        # Model instances compare equal on their primary key alone
+        for field in self.model._meta.fields:
+            if getattr(old, field.attname) != getattr(new, field.attname):
+                return True
+        return False
 
     def _get_cache_data(self):
         qs = self.model._default_manager
@@ -16,25 +16,26 @@ class RedisDict(CachedDict):
 
     """
     def __init__(self, keyspace, connection, *args, **kwargs):
-        super(CachedDict, self).__init__(*args, **kwargs)
+        super(RedisDict, self).__init__(*args, **kwargs)
 
         self.keyspace = keyspace
         self.conn = connection
 
         self.remote_cache_key = 'RedisDict:%s' % (keyspace,)
         self.remote_cache_last_updated_key = 'RedisDict.last_updated:%s' % (keyspace,)
+        self._bind_remote_cache_keys()
 
         request_finished.connect(self._cleanup)
 
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self.keyspace)
+
     def __setitem__(self, key, value):
         self.conn.hset(self.keyspace, key, value)
-        if value != self._local_cache.get(key):
-            self._local_cache[key] = value
         self._populate(reset=True)
 
     def __delitem__(self, key):
         self.conn.hdel(self.keyspace, key)
-        self._local_cache.pop(key)
         self._populate(reset=True)
 
     def _get_cache_data(self):
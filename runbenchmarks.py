@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+
+import sys
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+            }
+        },
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.contenttypes',
+
+            'modeldict',
+            'tests.modeldict',
+        ],
+        ROOT_URLCONF='',
+        DEBUG=False,
+    )
+
+import json
+import platform
+
+import django
+from django.db import connection
+
+
+def runbenchmarks(sizes, number, names=None, output=None, compare=None):
+    from tests.benchmarks.suite import BENCHMARKS
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    if compare:
+        with open(compare) as fp:
+            baseline = dict(
+                ((r['name'], r['size']), r['usec_per_op']) for r in json.load(fp)['results']
+            )
+    else:
+        baseline = {}
+
+    results = []
+    for func in BENCHMARKS:
+        name = func.__name__[len('bench_'):]
+        if names and name not in names:
+            continue
+
+        for size in sizes:
+            usec_per_op = func(size, number) * 1e6
+            results.append({'name': name, 'size': size, 'usec_per_op': usec_per_op})
+
+            line = '%-24s %8d %14.2f usec/op' % (name, size, usec_per_op)
+            if (name, size) in baseline:
+                line += '  %6.2fx' % (usec_per_op / baseline[(name, size)],)
+            print(line)
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump({
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'number': number,
+                'results': results,
+            }, fp, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--sizes', dest='sizes', default='10,100,1000',
+                      help='comma separated table sizes')
+    parser.add_option('--number', dest='number', default=10000, type=int,
+                      help='lookups per run, divided by 100 for writes and rebuilds')
+    parser.add_option('--output', dest='output', help='write the results as JSON to this file')
+    parser.add_option('--compare', dest='compare', help='compare with results from an earlier --output')
+    (options, args) = parser.parse_args()
+
+    runbenchmarks(
+        sizes=[int(size) for size in options.sizes.split(',')],
+        number=options.number,
+        names=args,
+        output=options.output,
+        compare=options.compare,
+    )
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+
+import atexit
+import shutil
+import sys
+import tempfile
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from django.conf import settings
+
+# Worker processes need a database and a cache they can all share
+tempdir = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, tempdir, True)
+
+if not settings.configured:
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': join(tempdir, 'simulation.db'),
+                'OPTIONS': {'timeout': 30},
+            }
+        },
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': join(tempdir, 'cache'),
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.contenttypes',
+
+            'modeldict',
+            'tests.modeldict',
+        ],
+        ROOT_URLCONF='',
+        # Records the queries made, so that they can be counted
+        DEBUG=True,
+    )
+
+import json
+
+from django.core.management import call_command
+
+
+def runsimulation(output=None, **options):
+    from tests.benchmarks.simulate import TOTALS, simulate
+
+    call_command('syncdb', interactive=False, verbosity=0)
+
+    report = simulate(**options)
+
+    print('%-16s %12s %12s %12s' % ('', 'total', 'per second', 'per request'))
+    for name in TOTALS:
+        print('%-16s %12d %12.2f %12.4f' % (
+            name, report['totals'][name], report['per_second'][name], report['per_request'][name],
+        ))
+    print('%.2f seconds elapsed' % (report['elapsed'],))
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('--workers', dest='workers', default=4, type=int)
+    parser.add_option('--duration', dest='duration', default=10, type=float, help='seconds to run for')
+    parser.add_option('--dicts', dest='dicts', default=1, type=int, help='dicts used by each worker')
+    parser.add_option('--rows', dest='rows', default=100, type=int)
+    parser.add_option('--timeout', dest='timeout', default=30, type=int, help='timeout of every dict')
+    parser.add_option('--reads', dest='reads', default=10, type=int, help='reads per request')
+    parser.add_option('--write-rate', dest='write_rate', default=0.01, type=float,
+                      help='chance of a request writing a key')
+    parser.add_option('--request-rate', dest='request_rate', default=0, type=float,
+                      help='requests per second for each worker, or 0 for as many as possible')
+    parser.add_option('--output', dest='output', help='write the report as JSON to this file')
+    (options, args) = parser.parse_args()
+
+    runsimulation(**options.__dict__)
@@ -0,0 +1,172 @@
+"""
+Simulates several processes serving requests through ``ModelDict``, sharing a
+cache and a database, to measure what a configuration costs in aggregate.
+
+Each worker process runs requests which read random keys, occasionally write
+one, and then send ``request_finished``. Database queries, cache operations,
+the bytes they move and rebuilds from the database are counted in every worker
+and summed up. Use ``runsimulation.py`` to run it.
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+import multiprocessing
+import random
+import time
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connection, reset_queries
+
+from modeldict import ModelDict
+from tests.benchmarks.suite import fill_table
+from tests.modeldict.models import ModelDictModel
+
+COUNTERS = ('requests', 'db_queries', 'cache_gets', 'cache_sets', 'cache_deletes', 'bytes_read',
+            'bytes_written', 'rebuilds')
+
+# Reported along with the counters summed up from every worker
+TOTALS = COUNTERS + ('stampedes',)
+
+
+class CountingCache(object):
+    """
+    Wraps a cache backend, counting the operations ``CachedDict`` uses and the
+    size of the values sent to and from the cache.
+    """
+    def __init__(self, cache, stats):
+        self.cache = cache
+        self.stats = stats
+
+    def get(self, key, default=None):
+        value = self.cache.get(key)
+        self.stats['cache_gets'] += 1
+        if value is None:
+            return default
+        self.stats['bytes_read'] += len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.stats['cache_sets'] += 1
+        self.stats['bytes_written'] += len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return self.cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        self.stats['cache_sets'] += 1
+        self.stats['bytes_written'] += len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return self.cache.add(key, value, timeout)
+
+    def delete(self, key):
+        self.stats['cache_deletes'] += 1
+        return self.cache.delete(key)
+
+
+class SimulatedModelDict(ModelDict):
+    """
+    Records when the dictionary is rebuilt from the database.
+    """
+    def __init__(self, *args, **kwargs):
+        self.rebuilds = kwargs.pop('rebuilds')
+        super(SimulatedModelDict, self).__init__(*args, **kwargs)
+
+    def _update_cache_data(self):
+        self.rebuilds.append(time.time())
+        super(SimulatedModelDict, self)._update_cache_data()
+
+
+def worker(idx, options, results):
+    random.seed(idx)
+
+    stats = dict.fromkeys(COUNTERS, 0)
+    rebuilds = []
+    remote_cache = CountingCache(cache, stats)
+
+    dicts = []
+    for n in xrange(options['dicts']):
+        mydict = SimulatedModelDict(ModelDictModel, key='key', value='value', cache=remote_cache,
+                                    timeout=options['timeout'], rebuilds=rebuilds)
+        # Give every dict its own cache keys, as separate dicts would have
+        mydict.remote_cache_key += ':%d' % n
+        mydict.remote_cache_last_updated_key += ':%d' % n
+        dicts.append(mydict)
+
+    interval = 1.0 / options['request_rate'] if options['request_rate'] else 0
+    deadline = time.time() + options['duration']
+
+    while time.time() < deadline:
+        started = time.time()
+
+        for _ in xrange(options['reads']):
+            random.choice(dicts).get('key%d' % random.randrange(options['rows']))
+
+        if random.random() < options['write_rate']:
+            key = 'key%d' % random.randrange(options['rows'])
+            random.choice(dicts)[key] = 'value%d' % random.randrange(1000000)
+
+        stats['db_queries'] += len(connection.queries)
+        reset_queries()
+        request_finished.send(sender=None)
+        stats['requests'] += 1
+
+        remaining = interval - (time.time() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    stats['rebuilds'] = len(rebuilds)
+    results.put((idx, stats, rebuilds))
+
+
+def simulate(workers=4, duration=10, dicts=1, rows=100, timeout=30, reads=10,
+             write_rate=0.01, request_rate=0):
+    """
+    Runs the simulation and returns the totals, the rates per second and per
+    request, and the time taken. Besides the counters, the totals include the
+    number of stampedes: seconds in which more than one process rebuilt from
+    the database.
+    """
+    options = {
+        'duration': duration,
+        'dicts': dicts,
+        'rows': rows,
+        'timeout': timeout,
+        'reads': reads,
+        'write_rate': write_rate,
+        'request_rate': request_rate,
+    }
+
+    fill_table(rows)
+    # Workers must open their own database connections
+    connection.close()
+
+    started = time.time()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(idx, options, results))
+        for idx in xrange(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    totals = dict.fromkeys(COUNTERS, 0)
+    rebuilders = {}
+    for _ in processes:
+        idx, stats, rebuilds = results.get()
+        for name in COUNTERS:
+            totals[name] += stats[name]
+        for when in rebuilds:
+            rebuilders.setdefault(int(when), set()).add(idx)
+
+    for process in processes:
+        process.join()
+
+    elapsed = time.time() - started
+    totals['stampedes'] = len([idxs for idxs in rebuilders.itervalues() if len(idxs) > 1])
+
+    requests = totals['requests'] or 1
+    return {
+        'options': dict(options, workers=workers),
+        'elapsed': elapsed,
+        'totals': totals,
+        'per_second': dict((name, value / elapsed) for name, value in totals.iteritems()),
+        'per_request': dict((name, float(value) / requests) for name, value in totals.iteritems()),
+    }
@@ -0,0 +1,164 @@
+"""
+Benchmarks for the hot paths of ``ModelDict`` and ``RedisDict``.
+
+Every benchmark is a function of ``(size, number)`` which fills the table with
+``size`` rows and returns the best time per operation over a few runs of
+``number`` operations. Use ``runbenchmarks.py`` to run them.
+"""
+from __future__ import absolute_import
+
+import gc
+import timeit
+
+from django.core.cache import cache
+
+from modeldict import ModelDict
+from modeldict.redis import RedisDict
+from tests.modeldict.models import ModelDictModel
+from tests.utils import FakeRedis
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def fill_table(size):
+    ModelDictModel.objects.all().delete()
+    cache.clear()
+    # Drop dicts from earlier benchmarks so their signal handlers don't run
+    gc.collect()
+
+    rows = [ModelDictModel(key='key%d' % n, value='value%d' % n) for n in xrange(size)]
+    if hasattr(ModelDictModel.objects, 'bulk_create'):
+        ModelDictModel.objects.bulk_create(rows)
+    else:
+        for row in rows:
+            row.save()
+
+
+def timed(func, number, repeat=3):
+    """
+    Returns the best time per call of ``func`` over ``repeat`` runs of
+    ``number`` calls.
+    """
+    return min(timeit.Timer(func).repeat(repeat, number)) / number
+
+
+def keys(size):
+    """
+    Cycles through the keys of a table with ``size`` rows.
+    """
+    n = [0]
+
+    def next_key():
+        n[0] = (n[0] + 1) % size
+        return 'key%d' % n[0]
+    return next_key
+
+
+def lookup_warm(size, number, instances=False):
+    fill_table(size)
+    mydict = ModelDict(ModelDictModel, key='key', value='value', instances=instances)
+    mydict['key0']
+    next_key = keys(size)
+
+    return timed(lambda: mydict[next_key()], number)
+
+
+@benchmark
+def bench_lookup_warm(size, number):
+    return lookup_warm(size, number)
+
+
+@benchmark
+def bench_lookup_warm_instances(size, number):
+    return lookup_warm(size, number, instances=True)
+
+
+@benchmark
+def bench_lookup_expired(size, number):
+    # A negative timeout checks the remote last updated key on every access
+    fill_table(size)
+    mydict = ModelDict(ModelDictModel, key='key', value='value', timeout=-1)
+    mydict['key0']
+    next_key = keys(size)
+
+    return timed(lambda: mydict[next_key()], number)
+
+
+def rebuild(size, number, instances=False):
+    fill_table(size)
+    mydict = ModelDict(ModelDictModel, key='key', value='value', instances=instances)
+
+    return timed(lambda: mydict._populate(reset=True), max(number // 100, 1))
+
+
+@benchmark
+def bench_rebuild(size, number):
+    return rebuild(size, number)
+
+
+@benchmark
+def bench_rebuild_instances(size, number):
+    return rebuild(size, number, instances=True)
+
+
+@benchmark
+def bench_save(size, number):
+    # Every save rebuilds the whole dict
+    fill_table(size)
+    mydict = ModelDict(ModelDictModel, key='key', value='value')
+    mydict['key0']
+    n = [0]
+
+    def save():
+        n[0] += 1
+        mydict['key%d' % (n[0] % size)] = 'new%d' % n[0]
+    return timed(save, max(number // 100, 1))
+
+
+@benchmark
+def bench_create_delete(size, number):
+    fill_table(size)
+    mydict = ModelDict(ModelDictModel, key='key', value='value')
+    mydict['key0']
+    n = [0]
+
+    def create_delete():
+        n[0] += 1
+        mydict['extra%d' % n[0]] = 'value'
+        del mydict['extra%d' % n[0]]
+    return timed(create_delete, max(number // 100, 1))
+
+
+def redis_dict(size):
+    cache.clear()
+    conn = FakeRedis()
+    for n in xrange(size):
+        conn.hset('benchmark', 'key%d' % n, 'value%d' % n)
+
+    mydict = RedisDict('benchmark', conn)
+    mydict['key0']
+    return mydict
+
+
+@benchmark
+def bench_redis_lookup_warm(size, number):
+    mydict = redis_dict(size)
+    next_key = keys(size)
+
+    return timed(lambda: mydict[next_key()], number)
+
+
+@benchmark
+def bench_redis_set(size, number):
+    mydict = redis_dict(size)
+    n = [0]
+
+    def save():
+        n[0] += 1
+        mydict['key%d' % (n[0] % size)] = 'new%d' % n[0]
+    return timed(save, max(number // 100, 1))
@@ -1,14 +1,18 @@
 from __future__ import absolute_import
 
 import mock
+import pickle
 import time
 
-from django.core.cache import cache
+from django.core.cache import cache, get_cache
 from django.core.signals import request_finished
 from django.test import TestCase, TransactionTestCase
 
 from modeldict import ModelDict
 from modeldict.base import CachedDict
+from modeldict.cache import TieredCache
+from modeldict.redis import RedisDict
+from tests.utils import FakeRedis
 from .models import ModelDictModel
 
 
@@ -163,6 +167,228 @@ class ModelDictTest(TransactionTestCase):
         self.assertEquals(len(mydict), 11)
         self.assertEquals(mydict['hello'], 'bar2')
 
+    def test_lookup(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', indexes=['value'])
+        mydict['foo'] = 'bar'
+        mydict['foo2'] = 'bar'
+        mydict['foo3'] = 'baz'
+        self.assertEquals(sorted(mydict.lookup('value', 'bar')), ['foo', 'foo2'])
+        self.assertEquals(mydict.lookup('value', 'baz'), ['foo3'])
+        self.assertEquals(mydict.lookup('value', 'missing'), [])
+
+        m = ModelDictModel.objects.get(key='foo2')
+        m.value = 'baz'
+        m.save()
+
+        self.assertEquals(mydict.lookup('value', 'bar'), ['foo'])
+        self.assertEquals(sorted(mydict.lookup('value', 'baz')), ['foo2', 'foo3'])
+
+    def test_lookup_instances(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', instances=True, indexes={
+            'first_letter': lambda k, v: v.value[:1],
+        })
+        mydict['foo'] = 'bar'
+        mydict['foo2'] = 'baz'
+        mydict['foo3'] = 'qux'
+        self.assertEquals(sorted(mydict.lookup('first_letter', 'b')), ['foo', 'foo2'])
+
+        ModelDictModel.objects.get(key='foo2').delete()
+        self.assertEquals(mydict.lookup('first_letter', 'b'), ['foo'])
+
+    def test_index_on_other_field_requires_instances(self):
+        self.assertRaises(ValueError, ModelDict, ModelDictModel, key='key', value='value', indexes=['key'])
+        ModelDict(ModelDictModel, key='key', value='value', instances=True, indexes=['key'])
+
+    def test_keys_with_prefix(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        for key in ('billing.a', 'billing.b', 'search.a', 'billing', 'bil'):
+            mydict[key] = 'foo'
+        self.assertEquals(list(mydict.keys_with_prefix('billing.')), ['billing.a', 'billing.b'])
+        self.assertEquals(list(mydict.keys_with_prefix('bil')), ['bil', 'billing', 'billing.a', 'billing.b'])
+        self.assertEquals(list(mydict.keys_with_prefix('missing')), [])
+
+        mydict['billing.c'] = 'foo'
+        self.assertEquals(list(mydict.keys_with_prefix('billing.')), ['billing.a', 'billing.b', 'billing.c'])
+
+    def test_sorted_keys_follow_snapshot(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        mydict['a'] = 'A'
+        mydict['b'] = 'B'
+        old_sorted_keys = mydict._get_sorted_keys()
+
+        del mydict['b']
+        # Another thread stores the keys it sorted from the old snapshot
+        mydict._local_sorted_keys = old_sorted_keys
+
+        self.assertEquals(list(mydict.items_in_range()), [('a', 'A')])
+        self.assertEquals(list(mydict.keys_with_prefix('')), ['a'])
+
+    def test_items_in_range(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        for key in ('a', 'b', 'c', 'd'):
+            mydict[key] = key.upper()
+        self.assertEquals(list(mydict.items_in_range('b', 'd')), [('b', 'B'), ('c', 'C')])
+        self.assertEquals(list(mydict.items_in_range(stop='b')), [('a', 'A')])
+        self.assertEquals(list(mydict.items_in_range('c')), [('c', 'C'), ('d', 'D')])
+        self.assertEquals(len(list(mydict.items_in_range())), 4)
+
+    def test_transform(self):
+        transform = mock.Mock(side_effect=lambda v: v.upper())
+        mydict = ModelDict(ModelDictModel, key='key', value='value', transform=transform)
+        mydict['foo'] = 'bar'
+        mydict['foo2'] = 'baz'
+        self.assertEquals(mydict['foo'], 'BAR')
+        self.assertEquals(mydict['foo2'], 'BAZ')
+
+        transform.reset_mock()
+        mydict['foo2'] = 'qux'
+        self.assertEquals(mydict['foo'], 'BAR')
+        self.assertEquals(mydict['foo2'], 'QUX')
+        transform.assert_called_once_with('qux')
+
+        transform.reset_mock()
+        mydict['foo'] = 'bar'
+        self.assertEquals(mydict['foo'], 'BAR')
+        self.assertFalse(transform.called)
+
+    def test_transform_stores_raw_values(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', transform=int)
+        mydict['foo'] = '1'
+        self.assertEquals(mydict['foo'], 1)
+        self.assertEquals(cache.get(mydict.remote_cache_key), {'foo': '1'})
+
+        mydict.clear_cache()
+        self.assertEquals(mydict['foo'], 1)
+
+    def test_transform_failure_keeps_snapshot(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', transform=int)
+        mydict['good'] = '1'
+        self.assertRaises(ValueError, mydict.__setitem__, 'bad', 'x')
+
+        self.assertEquals(mydict['good'], 1)
+        self.assertFalse('bad' in mydict)
+
+    def test_transform_instances(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', instances=True,
+                           transform=lambda i: i.value.upper())
+        mydict['foo'] = 'bar'
+        self.assertEquals(mydict['foo'], 'BAR')
+        mydict['foo'] = 'baz'
+        self.assertEquals(mydict['foo'], 'BAZ')
+
+    def test_snapshot(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        mydict['foo'] = 'bar'
+
+        with mydict.snapshot() as data:
+            self.assertEquals(data, {'foo': 'bar'})
+            self.assertTrue(data is mydict.snapshot())
+
+            mydict['foo'] = 'baz'
+            mydict['foo2'] = 'bar'
+            self.assertEquals(data, {'foo': 'bar'})
+
+        self.assertEquals(mydict.snapshot(), {'foo': 'baz', 'foo2': 'bar'})
+
+    def test_snapshot_follows_local_cache(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        mydict['foo'] = 'bar'
+        mydict.snapshot()
+        old_snapshot = mydict._local_snapshot
+
+        mydict['foo'] = 'baz'
+        # Another thread stores the copy it made of the old snapshot
+        mydict._local_snapshot = old_snapshot
+
+        self.assertEquals(mydict.snapshot(), {'foo': 'baz'})
+
+    def test_snapshot_is_read_only(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        mydict['foo'] = 'bar'
+        data = mydict.snapshot()
+        self.assertRaises(TypeError, data.__setitem__, 'foo', 'baz')
+        self.assertRaises(TypeError, data.__delitem__, 'foo')
+        self.assertRaises(TypeError, data.pop, 'foo')
+        self.assertRaises(TypeError, data.update, {})
+        self.assertEquals(pickle.loads(pickle.dumps(data)), data)
+
+    def test_subscribe(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        receiver = mock.Mock()
+        mydict.subscribe(receiver)
+
+        mydict['foo'] = 'bar'
+        receiver.assert_called_once_with(sender=mydict, added=set(['foo']), changed=set(), removed=set())
+
+        mydict['foo2'] = 'bar'
+        receiver.reset_mock()
+        mydict['foo'] = 'baz'
+        del mydict['foo2']
+        self.assertEquals(receiver.call_count, 2)
+        receiver.assert_any_call(sender=mydict, added=set(), changed=set(['foo']), removed=set())
+        receiver.assert_any_call(sender=mydict, added=set(), changed=set(), removed=set(['foo2']))
+
+        receiver.reset_mock()
+        mydict.clear_cache()
+        self.assertEquals(mydict['foo'], 'baz')
+        self.assertFalse(receiver.called)
+
+        mydict.unsubscribe(receiver)
+        mydict['foo'] = 'qux'
+        self.assertFalse(receiver.called)
+
+    @mock.patch('modeldict.base.logger')
+    def test_subscriber_errors_are_logged(self, logger):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        broken = mock.Mock(side_effect=Exception)
+        receiver = mock.Mock()
+        mydict.subscribe(broken)
+        mydict.subscribe(receiver)
+
+        mydict['foo'] = 'bar'
+
+        self.assertEquals(ModelDictModel.objects.get(key='foo').value, 'bar')
+        self.assertTrue(broken.called)
+        receiver.assert_called_once_with(sender=mydict, added=set(['foo']), changed=set(), removed=set())
+        self.assertEquals(logger.exception.call_count, 1)
+
+    def test_subscribe_remote_changes(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value')
+        other = ModelDict(ModelDictModel, key='key', value='value')
+        mydict['foo'] = 'bar'
+        self.assertEquals(other['foo'], 'bar')
+
+        seen = []
+        other.subscribe(lambda sender, added, changed, removed: seen.append((sender['foo'], changed)))
+        mydict['foo'] = 'baz'
+
+        # The other dict only notices the change once it rechecks the cache
+        self.assertEquals(seen, [])
+        other._last_checked_for_remote_changes = None
+        other._local_last_updated -= 1
+        self.assertEquals(other['foo'], 'baz')
+        self.assertEquals(seen, [('baz', set(['foo']))])
+
+    def test_subscribe_redis(self):
+        mydict = RedisDict('test_subscribe_redis', FakeRedis())
+        receiver = mock.Mock()
+        mydict.subscribe(receiver)
+
+        mydict['a'] = '1'
+        receiver.assert_called_once_with(sender=mydict, added=set(['a']), changed=set(), removed=set())
+
+        receiver.reset_mock()
+        mydict['a'] = '2'
+        receiver.assert_called_once_with(sender=mydict, added=set(), changed=set(['a']), removed=set())
+
+        receiver.reset_mock()
+        mydict['b'] = '3'
+        del mydict['b']
+        self.assertEquals(receiver.call_count, 2)
+        receiver.assert_any_call(sender=mydict, added=set(['b']), changed=set(), removed=set())
+        receiver.assert_any_call(sender=mydict, added=set(), changed=set(), removed=set(['b']))
+        self.assertEquals(mydict['a'], '2')
+
     def test_django_signals_are_connected(self):
         from django.db.models.signals import post_save, post_delete
         from django.core.signals import request_finished
@@ -338,3 +564,133 @@ class CachedDictTest(TestCase):
             self.mydict.remote_cache_last_updated_key
         )
         self.assertEquals(result, True)
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        self.local = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='local')
+        self.shared = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='shared')
+        self.local.clear()
+        self.shared.clear()
+        self.cache = TieredCache([self.local, self.shared], timeouts=[300, None])
+
+    def test_get_fills_closer_tiers(self):
+        self.shared.set('foo', 'bar')
+        self.assertEquals(self.cache.get('foo'), 'bar')
+        self.assertEquals(self.local.get('foo'), 'bar')
+        self.assertEquals(self.cache.get('missing'), None)
+        self.assertEquals(self.cache.get('missing', 'default'), 'default')
+
+    def test_set_writes_all_tiers(self):
+        self.cache.set('foo', 'bar')
+        self.assertEquals(self.local.get('foo'), 'bar')
+        self.assertEquals(self.shared.get('foo'), 'bar')
+
+        self.cache.delete('foo')
+        self.assertEquals(self.local.get('foo'), None)
+        self.assertEquals(self.shared.get('foo'), None)
+
+    def test_add_checks_last_tier(self):
+        self.local.set('foo', 'bar')
+        self.assertTrue(self.cache.add('foo', 'baz'))
+        self.assertEquals(self.local.get('foo'), 'baz')
+        self.assertFalse(self.cache.add('foo', 'qux'))
+        self.assertEquals(self.cache.get('foo'), 'baz')
+
+    def test_bound_keys_follow_version(self):
+        self.cache.bind('version', 'data')
+        self.cache.set('data', 'old')
+        self.cache.set('version', 1)
+
+        # Another host updates the shared tier, and our copy of the version expires
+        self.shared.set('data', 'new')
+        self.shared.set('version', 2)
+        self.local.delete('version')
+
+        self.assertEquals(self.cache.get('version'), 2)
+        self.assertEquals(self.cache.get('data'), 'new')
+        self.assertEquals(self.local.get('data'), 'new')
+
+    def test_bound_keys_kept_for_same_version(self):
+        self.cache.bind('version', 'data')
+        self.cache.set('data', 'old')
+        self.cache.set('version', 1)
+
+        # Our copy of the version expires, but the shared one is unchanged
+        self.local.delete('version')
+        self.shared.set('data', 'shared')
+
+        self.assertEquals(self.cache.get('version'), 1)
+        self.assertEquals(self.cache.get('data'), 'old')
+
+    def test_bound_keys_filled_under_version(self):
+        self.cache.bind('version', 'data')
+        self.shared.set('data', 'new')
+        self.shared.set('version', 1)
+
+        self.assertEquals(self.cache.get('version'), 1)
+        self.assertEquals(self.cache.get('data'), 'new')
+
+        self.local.delete('version')
+        self.assertEquals(self.cache.get('version'), 1)
+        self.assertEquals(self.local.get('data'), 'new')
+
+        self.shared.set('data', 'newer')
+        self.shared.set('version', 2)
+        self.local.delete('version')
+        self.assertEquals(self.cache.get('version'), 2)
+        self.assertEquals(self.local.get('data'), None)
+        self.assertEquals(self.cache.get('data'), 'newer')
+
+    def test_closer_tiers_need_timeouts(self):
+        self.assertRaises(ValueError, TieredCache, [self.local, self.shared], [None, None])
+        self.assertRaises(ValueError, TieredCache, [self.local, self.shared], [0, None])
+
+    def test_cacheddict_without_timeout_skips_closer_tiers(self):
+        mydict = CachedDict(cache=[self.local, self.shared], timeout=0)
+        self.assertTrue(mydict.remote_cache is self.shared)
+
+        mydict = CachedDict(cache=[self.local, self.shared], timeout=10)
+        self.assertEquals(mydict.remote_cache.timeouts, [10, None])
+
+    def test_cacheddict_binds_keys(self):
+        mydict = CachedDict(cache=[self.local, self.shared])
+        self.assertEquals(mydict.remote_cache._bound_keys, {
+            mydict.remote_cache_last_updated_key: set([mydict.remote_cache_key]),
+        })
+
+    def test_modeldict(self):
+        mydict = ModelDict(ModelDictModel, key='key', value='value', cache=[self.local, self.shared])
+        mydict['foo'] = 'bar'
+        self.assertEquals(self.local.get(mydict.remote_cache_key), {'foo': 'bar'})
+        self.assertEquals(self.shared.get(mydict.remote_cache_key), {'foo': 'bar'})
+
+        self.local.clear()
+        mydict.clear_cache()
+        self.assertEquals(mydict['foo'], 'bar')
+        self.assertEquals(self.local.get(mydict.remote_cache_key), {'foo': 'bar'})
+
+    def test_modeldict_closer_tiers_expire_with_timeout(self):
+        host_a = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='host_a')
+        host_b = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='host_b')
+        host_a.clear()
+        host_b.clear()
+        now = time.time()
+
+        with mock.patch('time.time', mock.Mock(return_value=now)):
+            dict_a = ModelDict(ModelDictModel, key='key', value='value', cache=[host_a, self.shared], timeout=10)
+            dict_b = ModelDict(ModelDictModel, key='key', value='value', cache=[host_b, self.shared], timeout=10)
+            dict_a['foo'] = 'old'
+            self.assertEquals(dict_b['foo'], 'old')
+
+        # Host B copies the last updated key into its own tier
+        with mock.patch('time.time', mock.Mock(return_value=now + 11)):
+            self.assertEquals(dict_b['foo'], 'old')
+            self.assertTrue(host_b.get(dict_b.remote_cache_last_updated_key))
+
+        with mock.patch('time.time', mock.Mock(return_value=now + 12)):
+            dict_a['foo'] = 'new'
+            self.assertEquals(dict_b['foo'], 'old')
+
+        with mock.patch('time.time', mock.Mock(return_value=now + 22)):
+            self.assertEquals(dict_b['foo'], 'new')
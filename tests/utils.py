@@ -0,0 +1,15 @@
+class FakeRedis(object):
+    """
+    Implements the hash commands used by ``RedisDict`` in memory.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def hset(self, name, key, value):
+        self.data.setdefault(name, {})[key] = value
+
+    def hdel(self, name, key):
+        self.data.get(name, {}).pop(key, None)
+
+    def hgetall(self, name):
+        return dict(self.data.get(name, {}))